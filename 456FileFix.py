@@ -1,25 +1,52 @@
 import os
+import errno
 import shutil
 import hashlib
+import ssl
+import platform
+import mmap
+import threading
 import logging
+import logging.handlers
 from tqdm import tqdm
 from pathlib import Path
-from collections import Counter
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import argparse
+import asyncio
 import json
+import sqlite3
 from dotenv import load_dotenv
 import time
 
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
 # Load environment variables
 load_dotenv()
 
 # Configure logging to log to a file
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+file_handler = logging.FileHandler("4NSIKfilefix.log")
+file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+# Buffer per-file records so the file is written in batches, not once per file
+log_buffer = logging.handlers.MemoryHandler(capacity=1000, flushLevel=logging.ERROR, target=file_handler)
+# Only warnings reach the console so progress bars stay readable
+console_handler = logging.StreamHandler()
+console_handler.setLevel(logging.WARNING)
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
+    format=LOG_FORMAT,
     handlers=[
-        logging.FileHandler("4NSIKfilefix.log"),
-        logging.StreamHandler()
+        log_buffer,
+        console_handler
     ]
 )
 
@@ -28,64 +55,337 @@ def load_config(config_file: str) -> dict:
     with open(config_file, 'r') as file:
         return json.load(file)
 
-def organize_files(folders: dict, download_dir: str) -> Counter:
-    """Organize files into separate folders based on their extensions."""
-    for folder, extensions in folders.items():
-        folder_path = Path(download_dir) / folder
-        if not folder_path.exists():
-            folder_path.mkdir(parents=True)
+# Files at least this large are hashed through mmap instead of read into memory
+MMAP_THRESHOLD = 1 << 20
 
-    file_counts = Counter()
-    total_files = len(os.listdir(download_dir))
+# Smaller files are read through a reused per-thread buffer of this size
+READ_CHUNK = 256 * 1024
+_thread_local = threading.local()
+
+# Progress bars redraw at most this many times per run
+PBAR_STEPS = 200
+
+# Hashing releases the GIL, so reads and hashing overlap across threads
+HASH_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# Digests are cached across runs next to the log file
+HASH_CACHE = "4NSIK.hashcache.db"
+
+# Cached digests are committed in batches of this many rows
+CACHE_COMMIT_ROWS = 500
+
+# Duplicate deletions are issued concurrently up to this limit
+UNLINK_CONCURRENCY = 32
+
+def new_hasher():
+    """Return a fresh hasher using the fastest available algorithm."""
+    if blake3 is not None:
+        return blake3.blake3(max_threads=blake3.blake3.AUTO)
+    if xxhash is not None:
+        return xxhash.xxh3_64()
+    return hashlib.new("sha256", usedforsecurity=False)
+
+# Digests from different algorithms must never be compared
+HASH_ALGORITHM = new_hasher().name
+
+def check_sha_acceleration() -> None:
+    """Warn if SHA-256 hashing will run without OpenSSL or CPU SHA extensions."""
+    if blake3 is not None or xxhash is not None:
+        return
+    # OpenSSL-backed hashes come from _hashlib; the builtin fallback is _sha256 and never uses SHA extensions
+    if type(hashlib.new("sha256", usedforsecurity=False)).__module__ != "_hashlib":
+        logging.warning("SHA-256 is using Python's builtin implementation instead of OpenSSL and will be slow; "
+                        "install blake3 or xxhash for faster duplicate detection")
+        return
+    # x86 and ARM name their SHA-256 instruction flags differently in /proc/cpuinfo
+    machine = platform.machine().lower()
+    if machine in ("x86_64", "amd64", "i386", "i686"):
+        sha_flag = "sha_ni"
+    elif machine in ("aarch64", "arm64") or machine.startswith("arm"):
+        sha_flag = "sha2"
+    else:
+        return
+    try:
+        with open("/proc/cpuinfo", 'r') as file:
+            flags = file.read()
+    except OSError:
+        return
+    if sha_flag not in flags.split():
+        logging.warning(f"CPU lacks SHA extensions, hashing with {ssl.OPENSSL_VERSION} SHA-256 will be slow; "
+                        "install blake3 or xxhash for faster duplicate detection")
+
+def read_buffer() -> memoryview:
+    """Return this thread's reusable read buffer."""
+    buf = getattr(_thread_local, 'buf', None)
+    if buf is None:
+        buf = _thread_local.buf = memoryview(bytearray(READ_CHUNK))
+    return buf
+
+def hash_file(file_path: str) -> str:
+    """Return the hex digest of a file's contents."""
+    hasher = new_hasher()
+    with open(file_path, "rb", buffering=0) as f:
+        if os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                hasher.update(mm)
+        else:
+            buf = read_buffer()
+            while n := f.readinto(buf):
+                hasher.update(buf[:n])
+    return hasher.hexdigest()
+
+def open_hash_cache(db_path: str) -> sqlite3.Connection:
+    """Open the persistent digest cache, creating it if needed."""
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(h)")]
+    if columns and "ctime" not in columns:
+        # Caches from before ctime was part of the key cannot be trusted
+        conn.execute("DROP TABLE h")
+    conn.execute("CREATE TABLE IF NOT EXISTS h(dev INT, ino INT, mtime INT, ctime INT, size INT, algo TEXT, "
+                 "digest TEXT, PRIMARY KEY(dev, ino))")
+    return conn
+
+def load_digests(conn: sqlite3.Connection) -> dict:
+    """Return every cached digest for the current algorithm, keyed by file identity."""
+    rows = conn.execute("SELECT dev, ino, mtime, ctime, size, digest FROM h WHERE algo=?", (HASH_ALGORITHM,))
+    return {(dev, ino, mtime, ctime, size): digest for dev, ino, mtime, ctime, size, digest in rows}
+
+def store_digest(conn: sqlite3.Connection, key: tuple, digest: str) -> None:
+    """Record a freshly computed digest, committing every CACHE_COMMIT_ROWS rows."""
+    conn.execute("INSERT OR REPLACE INTO h(dev, ino, mtime, ctime, size, algo, digest) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                 (*key, HASH_ALGORITHM, digest))
+    if conn.total_changes % CACHE_COMMIT_ROWS == 0:
+        conn.commit()
+
+def forget_digest(conn: sqlite3.Connection, key: tuple) -> None:
+    """Drop the cached digest of a deleted file so a reused inode cannot inherit it."""
+    conn.execute("DELETE FROM h WHERE dev=? AND ino=?", key[:2])
+
+def prune_digests(conn: sqlite3.Connection, stale_keys: list) -> None:
+    """Drop rows for files not seen this run, and rows from other hash algorithms."""
+    conn.executemany("DELETE FROM h WHERE dev=? AND ino=? AND mtime=? AND ctime=? AND size=?", stale_keys)
+    conn.execute("DELETE FROM h WHERE algo!=?", (HASH_ALGORITHM,))
+
+def file_key(path: str, st: os.stat_result) -> tuple:
+    """Return the (dev, inode, mtime_ns, ctime_ns, size) identity of a file.
+
+    ctime is included because, unlike mtime, it cannot be set back with utime.
+    """
+    if not st.st_ino:
+        # DirEntry.stat() leaves st_dev and st_ino zero on Windows
+        st = os.stat(path)
+    return (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_ctime_ns, st.st_size)
+
+def move_file(src: str, dst: str) -> bool:
+    """Move a file with a single rename, copying only across filesystems.
+
+    Returns False if the file had to be copied, in which case its old stat no longer applies.
+    """
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(src, dst)
+        return False
+    return True
+
+def scan_folder(folder_path: str) -> dict:
+    """List a folder once as a path to stat dict, with stat None for anything but files."""
+    with os.scandir(folder_path) as it:
+        return {entry.path: entry.stat() if entry.is_file() else None for entry in it}
+
+def same_file(path: str, other: str) -> bool:
+    """Check whether two paths name one file, as differently cased names do on case-insensitive filesystems."""
+    try:
+        return os.path.samefile(path, other)
+    except OSError:
+        return False
+
+def organize_files(folders: dict, download_dir: str, tree: dict) -> Counter:
+    """Organize files into separate folders based on their extensions.
+
+    Fills tree with a path to stat dict for every folder in download_dir so later
+    phases need not read them again. Folders outside the config map to None.
+    """
+    for folder in folders:
+        Path(download_dir, folder).mkdir(parents=True, exist_ok=True)
+
+    dest_dirs = {folder: os.path.join(download_dir, folder) for folder in folders}
+    for folder, dest_dir in dest_dirs.items():
+        tree[folder] = scan_folder(dest_dir)
+    # The first folder listing an extension wins, as in the config order. Plain
+    # suffixes like ".pdf" go in a dict; anything else, such as ".tar.gz", is
+    # matched with a prebuilt endswith tuple per folder. Both keep the folder's
+    # config position so the earliest match wins either way.
+    ext_map = {}
+    suffix_rules = []
+    for index, (folder, extensions) in enumerate(folders.items()):
+        compound = []
+        for extension in extensions:
+            extension = extension.lower()
+            if extension.startswith('.') and extension.count('.') == 1:
+                ext_map.setdefault(extension, (index, folder))
+            else:
+                compound.append(extension)
+        if compound:
+            suffix_rules.append((index, folder, tuple(compound)))
+    folded_folders = {folder.casefold(): folder for folder in folders}
+    # Files bound for each destination folder, moved by one thread per folder
+    plan = defaultdict(list)
+    with os.scandir(download_dir) as it:
+        entries = list(it)
     start_time = time.time()
-    pbar = tqdm(total=total_files, desc="Organizing files", unit="file", unit_scale=True)
-    for file in os.listdir(download_dir):
-        file_path = Path(download_dir) / file
-        if file_path.is_file():
-            for folder, extensions in folders.items():
-                if any(file.endswith(extension) for extension in extensions):
-                    destination_path = Path(download_dir) / folder / file
-                    shutil.move(file_path, destination_path)
-                    file_counts[folder] += 1
-                    logging.info(f"Moved {file} to {folder}")
+    pbar = tqdm(total=len(entries), desc="Organizing files", unit="file", unit_scale=True,
+                miniters=max(1, len(entries) // PBAR_STEPS), mininterval=0.2)
+    pbar_lock = threading.Lock()
+    for entry in entries:
+        if entry.is_file():
+            name = entry.name.lower()
+            match = ext_map.get(os.path.splitext(name)[1])
+            for index, rule_folder, suffixes in suffix_rules:
+                if match is not None and index >= match[0]:
+                    break
+                if name.endswith(suffixes):
+                    match = (index, rule_folder)
                     break
+            if match is not None:
+                plan[match[1]].append(entry)
+                continue
+        elif entry.is_dir() and entry.name not in tree:
+            # On case-insensitive filesystems a configured folder may be listed under other case
+            folder = folded_folders.get(entry.name.casefold())
+            if folder is None or not same_file(entry.path, dest_dirs[folder]):
+                tree[entry.name] = None
         pbar.update(1)
+
+    def move_into(folder: str) -> int:
+        # Each worker owns its folder's tree entry, so no locking is needed
+        files = tree[folder]
+        folded = defaultdict(list)
+        for path in files:
+            folded[path.casefold()].append(path)
+        moved = 0
+        for entry in plan[folder]:
+            with pbar_lock:
+                pbar.update(1)
+            destination_path = os.path.join(dest_dirs[folder], entry.name)
+            try:
+                # A rename keeps the inode, size and mtime, so the stat taken before it stays valid
+                st = entry.stat()
+                if not move_file(entry.path, destination_path):
+                    st = os.stat(destination_path)
+            except OSError as e:
+                # For example a directory already holds the destination name
+                logging.error(f"Could not move {entry.name} to {folder}: {e}")
+                continue
+            # Drop entries the move overwrote under a differently cased name
+            same_name = folded[destination_path.casefold()]
+            for other in same_name:
+                if other != destination_path and same_file(other, destination_path):
+                    del files[other]
+            same_name[:] = [path for path in same_name if path in files and path != destination_path]
+            same_name.append(destination_path)
+            files[destination_path] = st
+            moved += 1
+            logging.info(f"Moved {entry.name} to {folder}")
+        return moved
+
+    file_counts = Counter()
+    if plan:
+        with ThreadPoolExecutor(max_workers=len(plan)) as executor:
+            for folder, moved in zip(plan, executor.map(move_into, plan)):
+                if moved:
+                    file_counts[folder] = moved
     end_time = time.time()
     elapsed_time = end_time - start_time
     pbar.set_postfix({'Elapsed Time': f'{elapsed_time:.2f}s'})
     pbar.close()
     return file_counts
 
-def remove_duplicates(folders: dict, download_dir: str) -> None:
+async def gather_unlinks(duplicates: list[tuple[str, str]]) -> list:
+    """Delete (path, folder) duplicates concurrently, keeping at most UNLINK_CONCURRENCY in flight.
+
+    Returns one result per duplicate: None once deleted, or the exception that stopped it.
+    """
+    loop = asyncio.get_running_loop()
+    sem = asyncio.Semaphore(UNLINK_CONCURRENCY)
+
+    async def unlink(path: str, folder: str) -> None:
+        async with sem:
+            await loop.run_in_executor(None, os.unlink, path)
+        logging.info(f"Removed duplicate file {os.path.basename(path)} from {folder}")
+
+    return await asyncio.gather(*(unlink(path, folder) for path, folder in duplicates), return_exceptions=True)
+
+def remove_duplicates(folders: dict, tree: dict, hash_cache: sqlite3.Connection) -> None:
     """Remove duplicate files from each folder."""
+    duplicates = []
+    # One query up front keeps the per-file loop down to dict lookups
+    digests = load_digests(hash_cache)
+    live_keys = set()
     for folder in folders.keys():
-        folder_path = Path(download_dir) / folder
-        files = os.listdir(folder_path)
+        # Only files sharing a size with another file can be duplicates
+        sizes = defaultdict(list)
+        for path, st in tree[folder].items():
+            if st is not None:
+                sizes[st.st_size].append((path, st))
+        candidates = [item for bucket in sizes.values() if len(bucket) > 1 for item in bucket]
+        keys = [file_key(path, st) for path, st in candidates]
+        # Reading in inode order approximates on-disk order and cuts seeks
+        if candidates:
+            keys, candidates = zip(*sorted(zip(keys, candidates), key=lambda pair: pair[0][1]))
+        live_keys.update(keys)
+        cached = [digests.get(key) for key in keys]
         seen = set()
         start_time = time.time()
-        pbar = tqdm(total=len(files), desc=f"Removing duplicates from {folder}", unit="file", unit_scale=True)
-        for file in files:
-            file_path = folder_path / file
-            if file_path.is_file():
-                with open(file_path, "rb") as f:
-                    file_hash = hashlib.sha256(f.read()).hexdigest()
+        pbar = tqdm(total=len(candidates), desc=f"Removing duplicates from {folder}", unit="file", unit_scale=True,
+                    miniters=max(1, len(candidates) // PBAR_STEPS), mininterval=0.2)
+        with ThreadPoolExecutor(max_workers=HASH_WORKERS) as executor:
+            # Results arrive in submission order, so the first copy is always the one kept
+            misses = [path for (path, st), digest in zip(candidates, cached) if digest is None]
+            computed = executor.map(hash_file, misses)
+            for (path, st), key, file_hash in zip(candidates, keys, cached):
+                if file_hash is None:
+                    file_hash = next(computed)
+                    store_digest(hash_cache, key, file_hash)
                 if file_hash in seen:
-                    os.remove(file_path)
-                    logging.info(f"Removed duplicate file {file} from {folder}")
+                    duplicates.append((path, folder, key))
                 else:
                     seen.add(file_hash)
-            pbar.update(1)
+                pbar.update(1)
         end_time = time.time()
         elapsed_time = end_time - start_time
         pbar.set_postfix({'Elapsed Time': f'{elapsed_time:.2f}s'})
         pbar.close()
+    prune_digests(hash_cache, [key for key in digests if key not in live_keys])
+    hash_cache.commit()
+
+    results = asyncio.run(gather_unlinks([(path, folder) for path, folder, key in duplicates]))
+    for (path, folder, key), error in zip(duplicates, results):
+        if error is None:
+            del tree[folder][path]
+            forget_digest(hash_cache, key)
+        else:
+            logging.error(f"Could not remove duplicate file {os.path.basename(path)} from {folder}: {error}")
+    hash_cache.commit()
+
+def is_empty(folder_path: str) -> bool:
+    """Check whether a folder is empty without listing all of it."""
+    with os.scandir(folder_path) as it:
+        return next(it, None) is None
 
-def clean_up_empty_folders(download_dir: str) -> None:
+def clean_up_empty_folders(download_dir: str, tree: dict) -> None:
     """Clean up empty folders."""
-    for folder in os.listdir(download_dir):
-        folder_path = Path(download_dir) / folder
-        if folder_path.is_dir() and not os.listdir(folder_path):
-            folder_path.rmdir()
+    for folder, contents in tree.items():
+        folder_path = os.path.join(download_dir, folder)
+        if contents is None:
+            empty = is_empty(folder_path)
+        else:
+            empty = not contents
+        if empty:
+            os.rmdir(folder_path)
             logging.info(f"Removed empty folder {folder}")
 
 def generate_summary(file_counts: Counter) -> None:
@@ -109,10 +409,18 @@ def main(args: list[str]) -> None:
     folders = config['folders']
     download_dir = config['download_dir']
 
-    file_counts = organize_files(folders, download_dir)
-    remove_duplicates(folders, download_dir)
-    clean_up_empty_folders(download_dir)
+    check_sha_acceleration()
+    # Folder contents, read once and kept current as files are moved and removed
+    tree = {}
+    file_counts = organize_files(folders, download_dir, tree)
+    hash_cache = open_hash_cache(HASH_CACHE)
+    try:
+        remove_duplicates(folders, tree, hash_cache)
+    finally:
+        hash_cache.close()
+    clean_up_empty_folders(download_dir, tree)
     generate_summary(file_counts)
+    log_buffer.flush()
 
 if __name__ == "__main__":
     import sys
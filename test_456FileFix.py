@@ -0,0 +1,180 @@
+import os
+import importlib.util
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+# The module configures a log file in the working directory on import
+_workdir = tempfile.TemporaryDirectory()
+_cwd = os.getcwd()
+os.chdir(_workdir.name)
+try:
+    _spec = importlib.util.spec_from_file_location("filefix", Path(__file__).with_name("456FileFix.py"))
+    filefix = importlib.util.module_from_spec(_spec)
+    _spec.loader.exec_module(filefix)
+finally:
+    os.chdir(_cwd)
+
+class OverwriteOnMoveTest(unittest.TestCase):
+    """A file moved over an existing name must not be removed as its own duplicate."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.download_dir = self.tmp.name
+        self.folders = {"Pictures": [".jpg"]}
+        self.pictures = Path(self.download_dir, "Pictures")
+        self.pictures.mkdir()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_phases(self):
+        tree = {}
+        filefix.organize_files(self.folders, self.download_dir, tree)
+        hash_cache = filefix.open_hash_cache(":memory:")
+        try:
+            filefix.remove_duplicates(self.folders, tree, hash_cache)
+        finally:
+            hash_cache.close()
+        filefix.clean_up_empty_folders(self.download_dir, tree)
+
+    def test_same_name_overwrite_keeps_file(self):
+        (self.pictures / "a.jpg").write_bytes(b"old!")
+        Path(self.download_dir, "a.jpg").write_bytes(b"new!")
+
+        self.run_phases()
+
+        self.assertEqual((self.pictures / "a.jpg").read_bytes(), b"new!")
+
+    def test_case_insensitive_overwrite_keeps_file(self):
+        (self.pictures / "photo.jpg").write_bytes(b"old!")
+        Path(self.download_dir, "Photo.JPG").write_bytes(b"new!")
+        real_replace = os.replace
+
+        def replace_case_insensitive(src, dst):
+            # Emulate a case-insensitive filesystem, where the new name replaces the old one
+            real_replace(src, dst)
+            os.remove(self.pictures / "photo.jpg")
+            os.symlink(dst, self.pictures / "photo.jpg")
+
+        with mock.patch.object(filefix.os, "replace", replace_case_insensitive):
+            tree = {}
+            filefix.organize_files(self.folders, self.download_dir, tree)
+        os.remove(self.pictures / "photo.jpg")
+
+        self.assertEqual(list(tree["Pictures"]), [str(self.pictures / "Photo.JPG")])
+
+    def test_case_sensitive_names_stay_separate(self):
+        (self.pictures / "photo.jpg").write_bytes(b"old!")
+        Path(self.download_dir, "Photo.JPG").write_bytes(b"new!")
+
+        self.run_phases()
+
+        self.assertEqual((self.pictures / "photo.jpg").read_bytes(), b"old!")
+        self.assertEqual((self.pictures / "Photo.JPG").read_bytes(), b"new!")
+
+class FolderCaseTest(unittest.TestCase):
+    """A configured folder listed under other case is tracked once."""
+
+    def test_aliased_folder_cleanup(self):
+        with tempfile.TemporaryDirectory() as download_dir:
+            Path(download_dir, "Pictures").mkdir()
+            # Emulate a case-insensitive filesystem listing the folder as "pictures"
+            os.symlink(Path(download_dir, "Pictures"), Path(download_dir, "pictures"))
+            tree = {}
+
+            filefix.organize_files({"Pictures": [".jpg"]}, download_dir, tree)
+            filefix.clean_up_empty_folders(download_dir, tree)
+
+            self.assertEqual(list(tree), ["Pictures"])
+            self.assertFalse(Path(download_dir, "Pictures").exists())
+
+class HashCacheTest(unittest.TestCase):
+    """Cached digests must never make a unique file look like a duplicate."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pictures = Path(self.tmp.name, "Pictures")
+        self.pictures.mkdir()
+        self.folders = {"Pictures": [".jpg"]}
+        self.hash_cache = filefix.open_hash_cache(":memory:")
+
+    def tearDown(self):
+        self.hash_cache.close()
+        self.tmp.cleanup()
+
+    def remove_duplicates(self):
+        tree = {"Pictures": filefix.scan_folder(str(self.pictures))}
+        filefix.remove_duplicates(self.folders, tree, self.hash_cache)
+
+    def rows(self):
+        return self.hash_cache.execute("SELECT dev, ino FROM h").fetchall()
+
+    def test_reused_inode_with_matching_mtime_is_rehashed(self):
+        c = self.pictures / "c.jpg"
+        a2 = self.pictures / "a2.jpg"
+        c.write_bytes(b"CCCC")
+        a2.write_bytes(b"AAAA")
+        # A row left by an earlier file on the same inode, with the same size and mtime
+        st = os.stat(c)
+        stale_key = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_ctime_ns - 1, st.st_size)
+        filefix.store_digest(self.hash_cache, stale_key, filefix.hash_file(str(a2)))
+
+        self.remove_duplicates()
+
+        self.assertTrue(c.exists())
+        self.assertTrue(a2.exists())
+
+    def test_removed_duplicate_leaves_no_row(self):
+        (self.pictures / "a.jpg").write_bytes(b"AAAA")
+        (self.pictures / "b.jpg").write_bytes(b"AAAA")
+
+        self.remove_duplicates()
+
+        [kept] = list(self.pictures.iterdir())
+        st = os.stat(kept)
+        self.assertEqual(self.rows(), [(st.st_dev, st.st_ino)])
+
+    def test_rows_for_vanished_files_are_pruned(self):
+        filefix.store_digest(self.hash_cache, (1, 2, 3, 4, 5), "feed")
+
+        self.remove_duplicates()
+
+        self.assertEqual(self.rows(), [])
+
+class MoveErrorTest(unittest.TestCase):
+    """A file that cannot be moved is skipped without stopping the others."""
+
+    def test_directory_at_destination(self):
+        with tempfile.TemporaryDirectory() as download_dir:
+            Path(download_dir, "Pictures", "a.jpg").mkdir(parents=True)
+            Path(download_dir, "a.jpg").write_bytes(b"a")
+            Path(download_dir, "b.jpg").write_bytes(b"b")
+
+            file_counts = filefix.organize_files({"Pictures": [".jpg"]}, download_dir, {})
+
+            self.assertEqual(file_counts, {"Pictures": 1})
+            self.assertTrue(Path(download_dir, "a.jpg").is_file())
+            self.assertTrue(Path(download_dir, "Pictures", "b.jpg").is_file())
+
+class RoutingOrderTest(unittest.TestCase):
+    """The first folder in config order that matches a file gets it."""
+
+    def route(self, folders, name):
+        with tempfile.TemporaryDirectory() as download_dir:
+            Path(download_dir, name).write_bytes(b"x")
+            filefix.organize_files(folders, download_dir, {})
+            return [folder for folder in folders if Path(download_dir, folder, name).exists()]
+
+    def test_plain_suffix_before_later_dotless_rule(self):
+        self.assertEqual(self.route({"Docs": [".pdf"], "Misc": ["pdf"]}, "a.pdf"), ["Docs"])
+
+    def test_earlier_dotless_rule_before_plain_suffix(self):
+        self.assertEqual(self.route({"Misc": ["pdf"], "Docs": [".pdf"]}, "a.pdf"), ["Misc"])
+
+    def test_compound_suffix(self):
+        self.assertEqual(self.route({"Zips": [".zip"], "Archives": [".tar.gz"]}, "a.TAR.gz"), ["Archives"])
+
+if __name__ == "__main__":
+    unittest.main()
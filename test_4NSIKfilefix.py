@@ -30,9 +30,8 @@ def load_config(config_file: str) -> dict:
 
 def organize_files(folders: dict, download_dir: str) -> Counter:
     """Organize files into separate folders based on their extensions."""
-    for folder, extensions in folders.items():
-        if not Path(folder).exists():
-            Path(folder).mkdir(parents=True)
+    for folder in folders:
+        Path(folder).mkdir(parents=True, exist_ok=True)
 
     file_counts = Counter()
     total_files = len(os.listdir(download_dir))